@@ -0,0 +1,101 @@
+import datetime
+import os
+import threading
+import time
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+WEEKDAYS = ["lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo"]
+SLOTS_PER_WEEK = 7 * 24
+
+# Tiempo (segundos) que se reutiliza una matriz ya calculada para el mismo periodo y sede.
+CACHE_SECONDS = float(os.getenv("ANALYTICS_CACHE_SECONDS", "60"))
+CACHE_MAX_ENTRIES = 256
+# Peso relativo de cada semana anterior en el pronóstico (1.0 = promedio simple).
+FORECAST_DECAY = 0.8
+
+_cache: Dict[Tuple, Tuple[float, dict]] = {}
+# Los endpoints síncronos corren en el threadpool de FastAPI: el acceso a la caché se serializa
+_cache_lock = threading.Lock()
+
+
+def cache_get(key: Tuple):
+    with _cache_lock:
+        entry = _cache.get(key)
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    return entry[1]
+
+
+def cache_set(key: Tuple, value: dict):
+    with _cache_lock:
+        if len(_cache) >= CACHE_MAX_ENTRIES:
+            now = time.monotonic()
+            for stale in [k for k, (expires, _) in _cache.items() if expires < now]:
+                del _cache[stale]
+            if len(_cache) >= CACHE_MAX_ENTRIES:
+                _cache.clear()
+        _cache[key] = (time.monotonic() + CACHE_SECONDS, value)
+
+
+def local_today(utc_offset: int) -> datetime.date:
+    """Fecha actual en la hora local de la sede (las marcas de tiempo se guardan en UTC)."""
+    return (datetime.datetime.utcnow() + datetime.timedelta(hours=utc_offset)).date()
+
+
+def _slot_indexes(timestamps: Sequence[datetime.datetime], start: datetime.date, utc_offset: int):
+    """Semana relativa al inicio y franja (día * 24 + hora) de cada registro, en hora local."""
+    hours = np.array(timestamps, dtype="datetime64[h]") + np.timedelta64(utc_offset, "h")
+    days = hours.astype("datetime64[D]")
+    hour_of_day = (hours - days).astype(np.int64)
+    day_number = days.astype(np.int64)
+    weekday = (day_number + 3) % 7  # 1970-01-01 fue jueves; lunes = 0
+    start_day = np.datetime64(start, "D").astype(np.int64)
+    week = (day_number - start_day) // 7
+    return week, weekday * 24 + hour_of_day
+
+
+def build_occupancy(timestamps: Sequence[datetime.datetime], start: datetime.date, end: datetime.date,
+                    utc_offset: int = 0, forecast_days: int = 7) -> dict:
+    """
+    Matriz día de la semana x hora con el promedio de ingresos por franja y un pronóstico
+    para los próximos días, ponderando más las semanas recientes.
+    `start`/`end` son fechas locales; `end` es exclusivo.
+    """
+    weeks = max(1, -(-(end - start).days // 7))
+    counts = np.zeros((weeks, SLOTS_PER_WEEK))
+    if len(timestamps):
+        week, slot = _slot_indexes(timestamps, start, utc_offset)
+        valid = (week >= 0) & (week < weeks)
+        counts = np.bincount(week[valid] * SLOTS_PER_WEEK + slot[valid],
+                             minlength=weeks * SLOTS_PER_WEEK).reshape(weeks, SLOTS_PER_WEEK).astype(float)
+
+    # Qué días de la semana contiene cada semana del periodo (la última puede estar incompleta),
+    # para que los días ausentes no cuenten como cero visitas
+    period_days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D")).astype(np.int64)
+    present = np.zeros((weeks, 7))
+    present[(period_days - period_days[0]) // 7, (period_days + 3) % 7] = 1
+    counts = counts.reshape(weeks, 7, 24)
+
+    average = counts.sum(axis=0) / np.maximum(present.sum(axis=0), 1)[:, None]
+
+    weights = (FORECAST_DECAY ** np.arange(weeks - 1, -1, -1))[:, None] * present
+    expected = np.einsum("wd,wdh->dh", weights, counts) / np.maximum(weights.sum(axis=0), 1e-12)[:, None]
+
+    forecast = []
+    today = local_today(utc_offset)
+    for offset in range(forecast_days):
+        day = today + datetime.timedelta(days=offset)
+        for hour, value in enumerate(expected[day.weekday()].round(2).tolist()):
+            forecast.append({"Date": day, "Hour": hour, "ExpectedCheckIns": value})
+
+    return {
+        "StartDate": start,
+        "EndDate": end,
+        "UtcOffset": utc_offset,
+        "Weekdays": WEEKDAYS,
+        "TotalCheckIns": int(counts.sum()),
+        "AverageCheckIns": average.round(2).tolist(),
+        "Forecast": forecast,
+    }
@@ -0,0 +1,155 @@
+import datetime
+import json
+import os
+import queue
+import threading
+from collections import defaultdict
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import get_engine
+
+# Cola en memoria acotada: si se llena (base de datos caída o lenta), los eventos
+# se escriben en AUDIT_FALLBACK_FILE en lugar de crecer sin límite.
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1.0"))
+AUDIT_FALLBACK_FILE = os.getenv("AUDIT_FALLBACK_FILE", "audit_fallback.jsonl")
+
+_STOP = object()
+_queue: "queue.Queue" = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+_worker: Optional[threading.Thread] = None
+_fallback_lock = threading.Lock()
+
+
+def _json_default(obj: Any):
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def snapshot(db_obj, keys=None) -> Dict[str, Any]:
+    """Valores actuales de las columnas del objeto (todas, o solo `keys`)."""
+    attrs = inspect(db_obj).mapper.column_attrs
+    return {attr.key: getattr(db_obj, attr.key) for attr in attrs if keys is None or attr.key in keys}
+
+
+def record(db: Session, action: str, db_obj, before: Optional[Dict[str, Any]] = None):
+    """
+    Encola un evento de auditoría. Llamar después del commit, para no auditar escrituras revertidas.
+    - create: guarda el objeto completo.
+    - update: `before` son los valores previos de los campos enviados; solo se guardan los que cambiaron.
+    - delete: guarda el objeto completo como `before`.
+    """
+    if action == "create":
+        before, after = None, snapshot(db_obj)
+    elif action == "delete":
+        before, after = snapshot(db_obj), None
+    else:
+        current = snapshot(db_obj, before.keys())
+        changed = [key for key in before if before[key] != current[key]]
+        if not changed:
+            return
+        before = {key: before[key] for key in changed}
+        after = {key: current[key] for key in changed}
+
+    mapper = inspect(db_obj).mapper
+    entity_id = ":".join(str(value) for value in mapper.primary_key_from_instance(db_obj))
+    event = {
+        "TenantID": db.info.get("tenant_id") or getattr(db_obj, "TenantID", None),
+        "Timestamp": datetime.datetime.utcnow(),
+        "AdminUserID": getattr(db_obj, "AdminUserID", None),
+        "Action": action,
+        "Entity": mapper.local_table.name,
+        "EntityID": entity_id,
+        "Changes": json.dumps({"before": before, "after": after}, default=_json_default, ensure_ascii=False),
+    }
+
+    if _worker is None or not _worker.is_alive():
+        _flush([event])  # Sin worker (scripts, tests): escritura directa
+        return
+    try:
+        _queue.put_nowait(event)
+    except queue.Full:
+        _write_fallback([event])
+
+
+def _write_fallback(events: List[dict]):
+    with _fallback_lock, open(AUDIT_FALLBACK_FILE, "a", encoding="utf-8") as f:
+        for event in events:
+            f.write(json.dumps(event, default=_json_default, ensure_ascii=False) + "\n")
+
+
+def _flush(events: List[dict]):
+    """Inserta un lote por base de datos con un único executemany."""
+    by_engine = defaultdict(list)
+    for event in events:
+        by_engine[get_engine(event["TenantID"])].append(event)
+    for bind, batch in by_engine.items():
+        try:
+            with bind.begin() as conn:
+                conn.execute(models.AuditLog.__table__.insert(), batch)
+        except Exception as e:
+            print(f"Error al guardar {len(batch)} eventos de auditoría, se escriben en {AUDIT_FALLBACK_FILE}: {e}")
+            _write_fallback(batch)
+
+
+def _run():
+    stopping = False
+    while not stopping:
+        try:
+            item = _queue.get(timeout=AUDIT_FLUSH_SECONDS)
+        except queue.Empty:
+            continue
+        batch = []
+        while True:
+            if item is _STOP:
+                stopping = True
+            else:
+                batch.append(item)
+            if stopping or len(batch) >= AUDIT_BATCH_SIZE:
+                break
+            try:
+                item = _queue.get_nowait()
+            except queue.Empty:
+                break
+        if batch:
+            _flush(batch)
+    # Vacía lo que haya quedado detrás de la señal de parada
+    remaining = []
+    while True:
+        try:
+            item = _queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is not _STOP:
+            remaining.append(item)
+    if remaining:
+        _flush(remaining)
+
+
+def start():
+    """Arranca el worker que persiste los eventos en segundo plano."""
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    _worker = threading.Thread(target=_run, name="audit-writer", daemon=True)
+    _worker.start()
+
+
+def stop(timeout: float = 10.0):
+    """Detiene el worker tras persistir todos los eventos pendientes."""
+    global _worker
+    if _worker is None:
+        return
+    _queue.put(_STOP)
+    _worker.join(timeout)
+    if _worker.is_alive():
+        print("Advertencia: el worker de auditoría no terminó a tiempo; pueden quedar eventos sin guardar")
+    _worker = None
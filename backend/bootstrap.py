@@ -0,0 +1,159 @@
+import os
+import time
+from sqlalchemy import Column, UniqueConstraint, delete, func, insert, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import AddConstraint
+from . import crud, models
+from .database import DEFAULT_TENANT_ID, engine, engine_created_hooks
+
+# Tiempo máximo esperado (segundos) para el arranque; si se supera se avisa en el log.
+STARTUP_TIME_BUDGET = float(os.getenv("STARTUP_TIME_BUDGET", "2.0"))
+
+# Índices únicos de Email del esquema original; el email pasó a ser único por sede.
+LEGACY_EMAIL_INDEXES = {"AdminUsers": "ix_AdminUsers_Email", "Students": "ix_Students_Email"}
+
+
+def _quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _add_column(conn: Connection, column: Column, default: str):
+    """ALTER TABLE ... ADD de una columna NOT NULL; las filas existentes reciben `default` (literal SQL)."""
+    table = column.table.name
+    if column.name in {c["name"] for c in inspect(conn).get_columns(table)}:
+        return
+    quote = conn.dialect.identifier_preparer.quote
+    column_type = column.type.compile(dialect=conn.dialect)
+    if conn.dialect.name == "mssql":
+        ddl = (f"ALTER TABLE {quote(table)} ADD {quote(column.name)} {column_type} NOT NULL "
+               f"CONSTRAINT {quote(f'DF_{table}_{column.name}')} DEFAULT {default}")
+    else:
+        ddl = f"ALTER TABLE {quote(table)} ADD COLUMN {quote(column.name)} {column_type} NOT NULL DEFAULT {default}"
+    conn.execute(text(ddl))
+
+
+def _add_tenant_columns(conn: Connection):
+    for table in models.Base.metadata.sorted_tables:
+        if "TenantID" in table.c:
+            _add_column(conn, table.c.TenantID, _quote_literal(DEFAULT_TENANT_ID))
+
+
+def _add_version_columns(conn: Connection):
+    for model in (models.AdminUser, models.Student, models.Membership, models.Routine):
+        _add_column(conn, model.__table__.c.Version, "1")
+
+
+def _add_qr_generation(conn: Connection):
+    _add_column(conn, models.Membership.__table__.c.QrGeneration, "0")
+
+
+def _create_indexes(conn: Connection):
+    """Crea los índices y restricciones únicas de los modelos que falten; quita los únicos de Email globales."""
+    quote = conn.dialect.identifier_preparer.quote
+    for table in models.Base.metadata.sorted_tables:
+        inspector = inspect(conn)
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+        existing |= {c["name"] for c in inspector.get_unique_constraints(table.name)}
+        existing.discard(None)  # restricciones sin nombre
+
+        legacy = LEGACY_EMAIL_INDEXES.get(table.name)
+        if legacy in existing:
+            if conn.dialect.name == "mssql":
+                conn.execute(text(f"DROP INDEX {quote(legacy)} ON {quote(table.name)}"))
+            else:
+                conn.execute(text(f"DROP INDEX {quote(legacy)}"))
+
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+        for constraint in table.constraints:
+            if isinstance(constraint, UniqueConstraint) and constraint.name and constraint.name not in existing:
+                if conn.dialect.name == "mssql":
+                    conn.execute(AddConstraint(constraint))
+                else:  # SQLite no admite ADD CONSTRAINT: un índice único equivale
+                    columns = ", ".join(quote(c.name) for c in constraint.columns)
+                    conn.execute(text(f"CREATE UNIQUE INDEX {quote(constraint.name)} ON {quote(table.name)} ({columns})"))
+
+
+def _rebuild_revenue_summary(conn: Connection):
+    """Llena MembershipRevenueSummary con las membresías existentes de todas las sedes."""
+    summary = models.MembershipRevenueSummary.__table__
+    conn.execute(delete(summary))
+    conn.execute(insert(summary).from_select(crud.REVENUE_SUMMARY_COLUMNS, crud.revenue_summary_source()))
+
+
+# Pasos de migración, en orden. Se aplican los de versión mayor a la registrada, cada uno seguido
+# de su fila en SchemaVersion. Antes de ellos, create_all crea las tablas que falten (en una base
+# nueva, todas ya completas). Cada paso comprueba lo que ya existe: las versiones 1-3 solo
+# ejecutaban create_all, así que las bases marcadas con ellas pueden no tener las columnas nuevas.
+# Para cambiar el esquema se añade un paso al final; nunca se modifica uno ya publicado.
+MIGRATIONS = [
+    (4, "TenantID en las tablas existentes", _add_tenant_columns),
+    (5, "Version para el control de concurrencia", _add_version_columns),
+    (6, "QrGeneration en Memberships", _add_qr_generation),
+    (7, "Índices por sede y email único por sede", _create_indexes),
+    (8, "Resumen de ingresos desde las membresías existentes", _rebuild_revenue_summary),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _current_version(conn: Connection) -> int:
+    if not inspect(conn).has_table(models.SchemaVersion.__tablename__):
+        return 0
+    return conn.execute(select(func.max(models.SchemaVersion.Version))).scalar() or 0
+
+
+def ensure_schema(bind: Engine) -> bool:
+    """
+    Aplica los pasos de migración pendientes una sola vez, no en cada worker.
+    Si la versión registrada ya es la actual, solo cuesta una consulta.
+    Devuelve True si este proceso fue el que migró el esquema.
+    """
+    with bind.connect() as conn:
+        if _current_version(conn) >= SCHEMA_VERSION:
+            return False
+
+    with bind.begin() as conn:
+        if conn.dialect.name == "mssql":
+            # Serializa a los workers que arrancan a la vez; se libera al terminar la transacción
+            conn.execute(text(
+                "EXEC sp_getapplock @Resource = 'GymSystemSchema', @LockMode = 'Exclusive', "
+                "@LockOwner = 'Transaction', @LockTimeout = 60000"
+            ))
+        # Otro worker pudo aplicarlo mientras esperábamos el lock
+        current = _current_version(conn)
+        if current >= SCHEMA_VERSION:
+            return False
+        models.Base.metadata.create_all(bind=conn)
+        for version, description, step in MIGRATIONS:
+            if version > current:
+                step(conn)
+                conn.execute(models.SchemaVersion.__table__.insert().values(Version=version))
+                print(f"Migración v{version} aplicada: {description}")
+    return True
+
+
+def _check_schema(bind: Engine):
+    safe_url = bind.url.render_as_string(hide_password=True)
+    try:
+        if ensure_schema(bind):
+            print(f"Esquema v{SCHEMA_VERSION} aplicado en {safe_url}")
+    except Exception as e:
+        print(f"Error al verificar el esquema en {safe_url}: {e}")
+
+
+# Las bases dedicadas de cada sede se verifican al crear su motor, con la primera request de la sede
+engine_created_hooks.append(_check_schema)
+
+
+def run_startup() -> float:
+    """Verifica el esquema de la base principal; no abre conexiones a las bases de las sedes."""
+    started = time.perf_counter()
+    _check_schema(engine)
+
+    elapsed = time.perf_counter() - started
+    if elapsed > STARTUP_TIME_BUDGET:
+        print(f"Advertencia: el arranque tardó {elapsed:.2f}s (presupuesto: {STARTUP_TIME_BUDGET:.2f}s)")
+    else:
+        print(f"Arranque completado en {elapsed:.2f}s")
+    return elapsed
@@ -0,0 +1,20 @@
+from typing import Optional
+from fastapi import Header, HTTPException
+
+
+def if_match_version(if_match: Optional[str] = Header(default=None)) -> Optional[int]:
+    """Lee la versión esperada de la cabecera If-Match (ej. `"3"` o `W/"3"`)."""
+    if if_match is None:
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match header. Use the record Version.")
+
+
+def expected_version(body_version: Optional[int], header_version: Optional[int]) -> Optional[int]:
+    """La versión del cuerpo tiene prioridad sobre la cabecera If-Match."""
+    return body_version if body_version is not None else header_version
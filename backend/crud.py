@@ -1,14 +1,36 @@
+from sqlalchemy import DateTime, String, and_, case, func, insert, literal, or_, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from . import models, schemas
+from sqlalchemy.orm.exc import StaleDataError
+from . import audit, models, qr, schemas
+from .database import get_timezone
 import uuid
 import datetime # <--- SE AÑADIÓ ESTA LÍNEA
-from typing import List, Optional
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
 
 # --- Funciones Auxiliares ---
 def generate_id():
     """Genera un ID único similar a los de Firebase."""
     return uuid.uuid4().hex[:20] # 20 caracteres como ejemplo
 
+def _schema_columns(model, schema):
+    """Columnas del modelo que corresponden a los campos del schema de respuesta."""
+    return [getattr(model, field) for field in schema.model_fields]
+
+def check_version(db_obj, expected_version: Optional[int]):
+    """
+    Control de concurrencia optimista: rechaza la edición si el cliente leyó una versión anterior.
+    El UPDATE de SQLAlchemy además incluye `WHERE Version = ...` (version_id_col), así que una
+    escritura concurrente entre la lectura y el commit también termina en StaleDataError.
+    """
+    if expected_version is not None and db_obj.Version != expected_version:
+        raise StaleDataError(f"Version {expected_version} is stale; current version is {db_obj.Version}")
+
+def _rows_as_dicts(query) -> List[dict]:
+    """Devuelve las filas de una consulta por columnas como dicts, sin crear objetos ORM."""
+    return [row._asdict() for row in query]
+
 # --- Admin Users CRUD ---
 def get_admin_user(db: Session, user_id: str) -> Optional[models.AdminUser]:
     return db.query(models.AdminUser).filter(models.AdminUser.AdminUserID == user_id).first()
@@ -23,7 +45,7 @@ def create_admin_user(db: Session, user: schemas.AdminUserCreate) -> models.Admi
     db_user = models.AdminUser(**user.dict())
     db.add(db_user)
     db.commit()
-    db.refresh(db_user)
+    audit.record(db, "create", db_user)
     return db_user
 
 # --- Students CRUD ---
@@ -33,29 +55,46 @@ def get_student(db: Session, student_id: str) -> Optional[models.Student]:
 def get_students(db: Session, skip: int = 0, limit: int = 100) -> List[models.Student]:
     return db.query(models.Student).offset(skip).limit(limit).all()
 
+def get_students_rows(db: Session, skip: int = 0, limit: int = 100) -> List[dict]:
+    columns = _schema_columns(models.Student, schemas.Student)
+    return _rows_as_dicts(db.query(*columns).offset(skip).limit(limit))
+
 def create_student(db: Session, student: schemas.StudentCreate) -> models.Student:
     student_id = student.StudentID or generate_id()
     db_student = models.Student(**student.dict(exclude={"StudentID"}), StudentID=student_id)
     db.add(db_student)
     db.commit()
-    db.refresh(db_student)
+    audit.record(db, "create", db_student)
     return db_student
 
-def update_student(db: Session, student_id: str, student_update: schemas.StudentUpdate) -> Optional[models.Student]:
+def update_student(db: Session, student_id: str, student_update: schemas.StudentUpdate,
+                   expected_version: Optional[int] = None) -> Optional[models.Student]:
     db_student = get_student(db, student_id)
     if db_student:
-        update_data = student_update.dict(exclude_unset=True)
+        check_version(db_student, expected_version)
+        update_data = student_update.dict(exclude_unset=True, exclude={"Version"})
+        before = audit.snapshot(db_student, update_data.keys())
         for key, value in update_data.items():
             setattr(db_student, key, value)
         db.commit()
-        db.refresh(db_student)
+        audit.record(db, "update", db_student, before=before)
     return db_student
 
 def delete_student(db: Session, student_id: str) -> Optional[models.Student]:
     db_student = get_student(db, student_id)
     if db_student:
+        # Membresías, asistencias y rutinas se eliminan en cascada: se cargan antes para
+        # descontar las membresías del resumen de ingresos y auditar cada eliminación
+        cascaded = list(db_student.memberships) + list(db_student.attendance_records) + list(db_student.routines)
+        deltas = {}
+        for db_membership in db_student.memberships:
+            _add_revenue_delta(deltas, db_membership, -1)
+        _apply_revenue_deltas(db, deltas)
         db.delete(db_student)
         db.commit()
+        for db_child in cascaded:
+            audit.record(db, "delete", db_child)
+        audit.record(db, "delete", db_student)
     return db_student
 
 # --- Memberships CRUD ---
@@ -65,42 +104,273 @@ def get_membership(db: Session, membership_id: str) -> Optional[models.Membershi
 def get_memberships_by_student(db: Session, student_id: str, skip: int = 0, limit: int = 100) -> List[models.Membership]:
     return db.query(models.Membership).filter(models.Membership.StudentID == student_id).offset(skip).limit(limit).all()
 
+def get_memberships_by_student_rows(db: Session, student_id: str, skip: int = 0, limit: int = 100) -> List[dict]:
+    columns = _schema_columns(models.Membership, schemas.Membership)
+    return _rows_as_dicts(db.query(*columns).filter(models.Membership.StudentID == student_id).offset(skip).limit(limit))
+
 def get_memberships(db: Session, skip: int = 0, limit: int = 100) -> List[models.Membership]:
     return db.query(models.Membership).offset(skip).limit(limit).all()
 
+def get_memberships_rows(db: Session, skip: int = 0, limit: int = 100) -> List[dict]:
+    columns = _schema_columns(models.Membership, schemas.Membership)
+    return _rows_as_dicts(db.query(*columns).offset(skip).limit(limit))
+
+# Campos incluidos en el QR: si cambian, el código se reemite y los anteriores dejan de valer
+QR_FIELDS = ("StudentID", "StartDate", "EndDate")
+
+def reissue_qr_code(db: Session, db_membership: models.Membership):
+    """Emite un QR nuevo para la membresía e invalida los anteriores (sube QrGeneration)."""
+    tenant_id = db_membership.TenantID or db.info["tenant_id"]
+    db_membership.QrGeneration = (db_membership.QrGeneration or 0) + 1
+    db_membership.QrCodeData = qr.issue_token(
+        tenant_id,
+        db_membership.StudentID,
+        db_membership.MembershipID,
+        db_membership.QrGeneration,
+        db_membership.StartDate,
+        db_membership.EndDate,
+        get_timezone(tenant_id),
+    )
+
 def create_membership(db: Session, membership: schemas.MembershipCreate) -> models.Membership:
     membership_id = membership.MembershipID or generate_id()
     db_membership = models.Membership(**membership.dict(exclude={"MembershipID"}), MembershipID=membership_id)
+    reissue_qr_code(db, db_membership)
     db.add(db_membership)
+    deltas = {}
+    _add_revenue_delta(deltas, db_membership, 1)
+    _apply_revenue_deltas(db, deltas)
     db.commit()
-    db.refresh(db_membership)
+    audit.record(db, "create", db_membership)
     return db_membership
 
-def update_membership(db: Session, membership_id: str, membership_update: schemas.MembershipUpdate) -> Optional[models.Membership]:
+def update_membership(db: Session, membership_id: str, membership_update: schemas.MembershipUpdate,
+                      expected_version: Optional[int] = None) -> Optional[models.Membership]:
     db_membership = get_membership(db, membership_id)
     if db_membership:
-        update_data = membership_update.dict(exclude_unset=True)
+        check_version(db_membership, expected_version)
+        deltas = {}
+        _add_revenue_delta(deltas, db_membership, -1)
+        update_data = membership_update.dict(exclude_unset=True, exclude={"Version"})
+        before = audit.snapshot(db_membership, update_data.keys())
         for key, value in update_data.items():
             setattr(db_membership, key, value)
+        if any(key in before and before[key] != getattr(db_membership, key) for key in QR_FIELDS):
+            reissue_qr_code(db, db_membership)
+        _add_revenue_delta(deltas, db_membership, 1)
+        _apply_revenue_deltas(db, deltas)
         db.commit()
-        db.refresh(db_membership)
+        audit.record(db, "update", db_membership, before=before)
     return db_membership
 
 def delete_membership(db: Session, membership_id: str) -> Optional[models.Membership]:
     db_membership = get_membership(db, membership_id)
     if db_membership:
+        deltas = {}
+        _add_revenue_delta(deltas, db_membership, -1)
+        _apply_revenue_deltas(db, deltas)
         db.delete(db_membership)
         db.commit()
+        audit.record(db, "delete", db_membership)
     return db_membership
 
+# --- Revenue Summary ---
+RevenueKey = Tuple[datetime.date, str, str, str]
+
+def _revenue_key(membership: models.Membership) -> RevenueKey:
+    period = datetime.date(membership.StartDate.year, membership.StartDate.month, 1)
+    return (period, membership.Type, membership.AdminUserID or '', membership.PaymentStatus)
+
+def _add_revenue_delta(deltas: Dict[RevenueKey, list], membership: models.Membership, sign: int):
+    """Acumula el aporte (+1/-1) de una membresía al resumen, agrupado por clave."""
+    delta = deltas.setdefault(_revenue_key(membership), [0, Decimal(0)])
+    delta[0] += sign
+    delta[1] += sign * Decimal(membership.Amount)
+
+def _increment_revenue_row(db: Session, period, type_, admin_id, status, count, amount) -> bool:
+    """UPDATE incremental (Count = Count + n) de una fila del resumen; False si la fila no existe."""
+    summary = models.MembershipRevenueSummary
+    updated = db.query(summary).filter(
+        summary.Period == period,
+        summary.Type == type_,
+        summary.AdminUserID == admin_id,
+        summary.PaymentStatus == status
+    ).update({
+        summary.MembershipCount: summary.MembershipCount + count,
+        summary.TotalAmount: summary.TotalAmount + amount
+    }, synchronize_session=False)
+    return updated > 0
+
+def _apply_revenue_deltas(db: Session, deltas: Dict[RevenueKey, list]):
+    """
+    Aplica los cambios al resumen dentro de la transacción actual.
+    Los incrementos son atómicos, así que no se pierden escrituras concurrentes. Si la fila no existe
+    se inserta dentro de un SAVEPOINT: cuando otra transacción la inserta a la vez, el INSERT falla
+    por clave duplicada, se revierte solo el SAVEPOINT y se vuelve a aplicar el UPDATE, de modo que
+    el mantenimiento del resumen nunca hace fallar la escritura de la membresía.
+    """
+    summary = models.MembershipRevenueSummary
+    for (period, type_, admin_id, status), (count, amount) in deltas.items():
+        if count == 0 and amount == 0:
+            continue
+        if _increment_revenue_row(db, period, type_, admin_id, status, count, amount):
+            continue
+        # Se escriben antes los cambios pendientes para que un error de la membresía no se confunda
+        # con el de la fila del resumen
+        db.flush()
+        try:
+            with db.begin_nested():
+                db.execute(insert(summary).values(
+                    TenantID=db.info["tenant_id"], Period=period, Type=type_, AdminUserID=admin_id,
+                    PaymentStatus=status, MembershipCount=count, TotalAmount=amount
+                ))
+        except IntegrityError:
+            _increment_revenue_row(db, period, type_, admin_id, status, count, amount)
+
+REVENUE_SUMMARY_COLUMNS = ["TenantID", "Period", "Type", "AdminUserID", "PaymentStatus", "MembershipCount", "TotalAmount"]
+
+def revenue_summary_source(tenant_id: Optional[str] = None):
+    """SELECT agrupado de Memberships con las columnas de REVENUE_SUMMARY_COLUMNS; todas las sedes si no se indica una."""
+    m = models.Membership
+    period = func.datefromparts(func.year(m.StartDate), func.month(m.StartDate), 1)
+    admin_id = func.coalesce(m.AdminUserID, '')
+    source = select(
+        m.TenantID, period, m.Type, admin_id, m.PaymentStatus, func.count(), func.sum(m.Amount)
+    ).group_by(m.TenantID, period, m.Type, admin_id, m.PaymentStatus)
+    if tenant_id is not None:
+        source = source.where(m.TenantID == tenant_id)
+    return source
+
+def rebuild_revenue_summary(db: Session) -> int:
+    """Recalcula el resumen de la sede actual desde Memberships con un único INSERT ... SELECT agrupado."""
+    summary = models.MembershipRevenueSummary
+    db.query(summary).delete(synchronize_session=False)
+    # El INSERT ... SELECT no pasa por el filtro automático de sede, así que se filtra en el SELECT
+    result = db.execute(insert(summary).from_select(
+        REVENUE_SUMMARY_COLUMNS, revenue_summary_source(db.info["tenant_id"])
+    ))
+    db.commit()
+    return result.rowcount
+
+# --- Reports ---
+def _paid_amount(summary):
+    return func.sum(case((summary.PaymentStatus == 'pagado', summary.TotalAmount), else_=0))
+
+def _pending_amount(summary):
+    return func.sum(case((summary.PaymentStatus == 'pendiente', summary.TotalAmount), else_=0))
+
+def _filter_periods(query, summary, start: Optional[datetime.date], end: Optional[datetime.date]):
+    if start:
+        query = query.filter(summary.Period >= datetime.date(start.year, start.month, 1))
+    if end:
+        query = query.filter(summary.Period <= datetime.date(end.year, end.month, 1))
+    return query
+
+def get_revenue_report(db: Session, group_by: str, start: Optional[datetime.date] = None,
+                       end: Optional[datetime.date] = None) -> List[dict]:
+    summary = models.MembershipRevenueSummary
+    key_column = {
+        "period": summary.Period,
+        "type": summary.Type,
+        "admin": summary.AdminUserID,
+    }[group_by]
+    query = db.query(
+        key_column.label("Key"),
+        func.sum(summary.MembershipCount).label("MembershipCount"),
+        func.sum(summary.TotalAmount).label("TotalAmount"),
+        _paid_amount(summary).label("PaidAmount"),
+        _pending_amount(summary).label("PendingAmount")
+    )
+    query = _filter_periods(query, summary, start, end)
+    rows = query.group_by(key_column).order_by(key_column).all()
+    return [{**row._asdict(), "Key": str(row.Key)} for row in rows]
+
+def get_collection_rate(db: Session, start: Optional[datetime.date] = None,
+                        end: Optional[datetime.date] = None) -> dict:
+    summary = models.MembershipRevenueSummary
+    query = db.query(
+        func.sum(summary.TotalAmount).label("TotalAmount"),
+        _paid_amount(summary).label("PaidAmount"),
+        _pending_amount(summary).label("PendingAmount")
+    )
+    row = _filter_periods(query, summary, start, end).one()
+    total = row.TotalAmount or Decimal(0)
+    paid = row.PaidAmount or Decimal(0)
+    return {
+        "StartPeriod": start,
+        "EndPeriod": end,
+        "TotalAmount": total,
+        "PaidAmount": paid,
+        "PendingAmount": row.PendingAmount or Decimal(0),
+        "CollectionRate": float(paid / total) if total else 0.0,
+    }
+
+def get_outstanding_balances(db: Session, skip: int = 0, limit: int = 100) -> List[dict]:
+    m = models.Membership
+    pending_amount = func.sum(m.Amount)
+    rows = db.query(
+        m.StudentID,
+        func.max(m.StudentName).label("StudentName"),
+        func.count().label("PendingMemberships"),
+        pending_amount.label("PendingAmount")
+    ).filter(m.PaymentStatus == 'pendiente').group_by(m.StudentID).order_by(pending_amount.desc()).offset(skip).limit(limit).all()
+    return [row._asdict() for row in rows]
+
 # --- Attendance CRUD ---
 def create_attendance(db: Session, attendance: schemas.AttendanceCreate) -> models.Attendance:
     db_attendance = models.Attendance(**attendance.dict())
     db.add(db_attendance)
     db.commit()
-    db.refresh(db_attendance)
+    audit.record(db, "create", db_attendance)
     return db_attendance
 
+def create_attendance_from_qr(db: Session, claims: qr.QrClaims, admin_user_id: Optional[str] = None) -> Optional[models.Attendance]:
+    """
+    Registra la asistencia de un QR ya verificado con un único INSERT ... SELECT.
+    Solo inserta si la membresía existe en la sede y su QrGeneration coincide con la del código;
+    devuelve None si el código fue reemplazado (revocado) o la membresía ya no existe.
+    """
+    m = models.Membership
+    a = models.Attendance
+    source = select(
+        m.TenantID, m.StudentID, m.StudentName, literal(datetime.datetime.utcnow(), DateTime),
+        m.MembershipID, m.Type, literal('registrado'), literal(admin_user_id, String)
+    ).where(
+        m.MembershipID == claims.MembershipID,
+        m.StudentID == claims.StudentID,
+        m.TenantID == claims.TenantID,
+        m.QrGeneration == claims.Generation
+    )
+    db_attendance = db.scalars(insert(a).from_select(
+        ["TenantID", "StudentID", "StudentName", "Timestamp", "MembershipID", "MembershipType", "Status", "AdminUserID"],
+        source
+    ).returning(a)).first()
+    if db_attendance is None:
+        db.rollback()
+        return None
+    db.commit()
+    audit.record(db, "create", db_attendance)
+    return db_attendance
+
+def reissue_legacy_qr_codes(db: Session, batch_size: int = 500) -> int:
+    """
+    Reemite los QR de la sede que no tienen el formato actual firmado con la clave activa (o no tienen QR).
+    Tras rotar la clave, permite retirar la anterior de QR_SIGNING_KEYS.
+    """
+    m = models.Membership
+    current_prefix = f"{qr.TOKEN_VERSION}.{qr.ACTIVE_KEY_ID}."
+    reissued = 0
+    while True:
+        batch = db.query(m).filter(
+            or_(m.QrCodeData.is_(None), ~m.QrCodeData.startswith(current_prefix, autoescape=True))
+        ).limit(batch_size).all()
+        if not batch:
+            return reissued
+        for db_membership in batch:
+            reissue_qr_code(db, db_membership)
+        db.commit()
+        reissued += len(batch)
+
 def get_attendance_by_student_and_date(db: Session, student_id: str, date: datetime.date) -> List[models.Attendance]:
     start_of_day = datetime.datetime.combine(date, datetime.time.min)
     end_of_day = datetime.datetime.combine(date, datetime.time.max)
@@ -119,6 +389,90 @@ def get_attendance_today(db: Session, skip: int = 0, limit: int = 100) -> List[m
         models.Attendance.Timestamp <= end_of_day
     ).order_by(models.Attendance.Timestamp.desc()).offset(skip).limit(limit).all()
 
+def get_attendance_timestamps(db: Session, start: datetime.datetime, end: datetime.datetime) -> List[datetime.datetime]:
+    """Solo la columna Timestamp del rango, para análisis (sin cargar objetos ORM)."""
+    rows = db.query(models.Attendance.Timestamp).filter(
+        models.Attendance.Timestamp >= start,
+        models.Attendance.Timestamp < end
+    ).all()
+    return [row.Timestamp for row in rows]
+
+# --- Student Activity (inactividad) ---
+ACTIVITY_WINDOW_DAYS = 30
+
+def refresh_student_activity(db: Session, now: Optional[datetime.datetime] = None) -> int:
+    """
+    Recalcula StudentActivitySummary para la sede actual con un único INSERT ... SELECT:
+    última visita, visitas en las dos últimas ventanas y membresía vigente de cada alumno.
+    """
+    now = now or datetime.datetime.utcnow()
+    tenant_id = db.info["tenant_id"]
+    recent_start = now - datetime.timedelta(days=ACTIVITY_WINDOW_DAYS)
+    previous_start = recent_start - datetime.timedelta(days=ACTIVITY_WINDOW_DAYS)
+    a = models.Attendance
+    m = models.Membership
+    st = models.Student
+    summary = models.StudentActivitySummary
+
+    visits = select(
+        a.StudentID,
+        func.max(a.Timestamp).label("LastVisit"),
+        func.sum(case((a.Timestamp >= recent_start, 1), else_=0)).label("RecentVisits"),
+        func.sum(case(((a.Timestamp >= previous_start) & (a.Timestamp < recent_start), 1), else_=0)).label("PreviousVisits")
+    ).where(a.TenantID == tenant_id).group_by(a.StudentID).subquery()
+    active = select(
+        m.StudentID,
+        func.max(m.EndDate).label("MembershipEndDate")
+    ).where(m.TenantID == tenant_id, m.StartDate <= now, m.EndDate >= now).group_by(m.StudentID).subquery()
+    source = select(
+        st.TenantID,
+        st.StudentID,
+        st.Nombre + ' ' + st.Apellido,
+        visits.c.LastVisit,
+        func.coalesce(visits.c.RecentVisits, 0),
+        func.coalesce(visits.c.PreviousVisits, 0),
+        active.c.MembershipEndDate,
+        literal(now)
+    ).select_from(
+        st.__table__
+        .outerjoin(visits, visits.c.StudentID == st.StudentID)
+        .outerjoin(active, active.c.StudentID == st.StudentID)
+    ).where(st.TenantID == tenant_id)
+
+    db.query(summary).delete(synchronize_session=False)
+    result = db.execute(insert(summary).from_select(
+        ["TenantID", "StudentID", "StudentName", "LastVisit", "RecentVisits", "PreviousVisits",
+         "MembershipEndDate", "ComputedAt"], source
+    ))
+    db.commit()
+    return result.rowcount
+
+def get_inactive_students(db: Session, inactive_days: Optional[int] = None, min_drop: Optional[float] = None,
+                          only_active: bool = True, skip: int = 0, limit: int = 100) -> List[models.StudentActivitySummary]:
+    """
+    Alumnos sin visitas en `inactive_days` días o cuya frecuencia cayó al menos `min_drop`
+    (0.5 = 50 %) respecto a la ventana anterior; sin criterios, todos. Se consulta solo la tabla de resumen.
+    Los días se cuentan hasta el último cálculo del resumen (ComputedAt), igual que las ventanas
+    de visitas: si el job se atrasa, los dos criterios siguen refiriéndose al mismo momento.
+    """
+    summary = models.StudentActivitySummary
+    conditions = []
+    if inactive_days is not None:
+        computed_at = db.query(func.max(summary.ComputedAt)).scalar()
+        if computed_at is None:
+            return []
+        cutoff = computed_at - datetime.timedelta(days=inactive_days)
+        conditions.append(or_(summary.LastVisit.is_(None), summary.LastVisit < cutoff))
+    if min_drop is not None:
+        conditions.append(and_(summary.PreviousVisits > 0,
+                               summary.RecentVisits <= summary.PreviousVisits * (1 - min_drop)))
+    query = db.query(summary)
+    if conditions:
+        query = query.filter(or_(*conditions))
+    if only_active:
+        query = query.filter(summary.MembershipEndDate.isnot(None))
+    return query.order_by(summary.LastVisit, summary.StudentID).offset(skip).limit(limit).all()
+
 # --- Routines CRUD ---
 def get_routine(db: Session, routine_id: str) -> Optional[models.Routine]:
     return db.query(models.Routine).filter(models.Routine.RoutineID == routine_id).first()
@@ -131,17 +485,20 @@ def create_routine(db: Session, routine: schemas.RoutineCreate) -> models.Routin
     db_routine = models.Routine(**routine.dict(exclude={"RoutineID"}), RoutineID=routine_id)
     db.add(db_routine)
     db.commit()
-    db.refresh(db_routine)
+    audit.record(db, "create", db_routine)
     return db_routine
 
-def update_routine(db: Session, routine_id: str, routine_update: schemas.RoutineUpdate) -> Optional[models.Routine]:
+def update_routine(db: Session, routine_id: str, routine_update: schemas.RoutineUpdate,
+                   expected_version: Optional[int] = None) -> Optional[models.Routine]:
     db_routine = get_routine(db, routine_id)
     if db_routine:
-        update_data = routine_update.dict(exclude_unset=True)
+        check_version(db_routine, expected_version)
+        update_data = routine_update.dict(exclude_unset=True, exclude={"Version"})
+        before = audit.snapshot(db_routine, update_data.keys())
         for key, value in update_data.items():
             setattr(db_routine, key, value)
         db.commit()
-        db.refresh(db_routine)
+        audit.record(db, "update", db_routine, before=before)
     return db_routine
 
 def delete_routine(db: Session, routine_id: str) -> Optional[models.Routine]:
@@ -149,4 +506,5 @@ def delete_routine(db: Session, routine_id: str) -> Optional[models.Routine]:
     if db_routine:
         db.delete(db_routine)
         db.commit()
+        audit.record(db, "delete", db_routine)
     return db_routine
@@ -0,0 +1,56 @@
+"""
+Tareas programadas. Ejecutar desde cron o el programador de tareas, por ejemplo cada noche:
+
+    python -m backend.jobs
+
+Tareas puntuales:
+
+    python -m backend.jobs reissue-qr        # Reemite los QR con formato antiguo o firmados con otra clave
+    python -m backend.jobs revenue-summary   # Recalcula el resumen de ingresos desde Memberships
+"""
+import sys
+from . import crud, models
+from .database import SessionLocal, get_all_engines
+
+
+def _tenant_sessions():
+    """Una sesión por sede, con el filtro de sede activo, en cada base de datos."""
+    for bind in get_all_engines():
+        with SessionLocal(bind=bind) as db:
+            tenant_ids = [row[0] for row in db.query(models.Student.TenantID).distinct().all()]
+        for tenant_id in tenant_ids:
+            with SessionLocal(bind=bind) as db:
+                db.info["tenant_id"] = tenant_id
+                yield tenant_id, db
+
+
+def refresh_student_activity_all_tenants():
+    """Recalcula el resumen de actividad de cada sede en cada base de datos."""
+    for tenant_id, db in _tenant_sessions():
+        rows = crud.refresh_student_activity(db)
+        print(f"Actividad de alumnos recalculada para la sede '{tenant_id}': {rows} registros")
+
+
+def reissue_legacy_qr_codes_all_tenants():
+    """Reemite los QR sin firma (formato "studentId:...;membershipType:..."), de versiones anteriores o firmados con otra clave."""
+    for tenant_id, db in _tenant_sessions():
+        rows = crud.reissue_legacy_qr_codes(db)
+        print(f"Códigos QR reemitidos para la sede '{tenant_id}': {rows}")
+
+
+def rebuild_revenue_summary_all_tenants():
+    """Recalcula el resumen de ingresos de cada sede, por si se desvió de Memberships."""
+    for tenant_id, db in _tenant_sessions():
+        rows = crud.rebuild_revenue_summary(db)
+        print(f"Resumen de ingresos recalculado para la sede '{tenant_id}': {rows} registros")
+
+
+JOBS = {
+    "student-activity": refresh_student_activity_all_tenants,
+    "reissue-qr": reissue_legacy_qr_codes_all_tenants,
+    "revenue-summary": rebuild_revenue_summary_all_tenants,
+}
+
+
+if __name__ == "__main__":
+    JOBS[sys.argv[1] if len(sys.argv) > 1 else "student-activity"]()
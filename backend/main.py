@@ -1,23 +1,31 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from . import models
-from .database import engine
-from .routers import students, memberships, attendance, routines, admin_users
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from . import audit
+from .bootstrap import run_startup
+from .routers import students, memberships, attendance, routines, admin_users, reports, analytics
 
-# Crea las tablas en la base de datos si no existen
-# ¡Cuidado! En producción, podrías querer usar migraciones (Alembic).
-print("Creando tablas en la base de datos (si no existen)...")
-try:
-    models.Base.metadata.create_all(bind=engine)
-    print("Tablas creadas o ya existentes.")
-except Exception as e:
-    print(f"Error al crear tablas: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El esquema se verifica al arrancar cada worker, pero solo se aplica una vez por versión
+    # (tabla SchemaVersion). Para cambios sobre tablas existentes usa migraciones (Alembic).
+    await run_in_threadpool(run_startup)
+    audit.start()
+    yield
+    # Persiste los eventos de auditoría pendientes antes de terminar el worker
+    await run_in_threadpool(audit.stop)
 
 
 app = FastAPI(
     title="Sistema de Gestión de Gimnasio API",
     description="API para gestionar alumnos, membresías, asistencia y rutinas.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configuración de CORS (Cross-Origin Resource Sharing)
@@ -38,12 +46,31 @@ app.add_middleware(
     allow_headers=["*"],    # Permite todas las cabeceras
 )
 
+# Conflictos de concurrencia optimista (ver crud.check_version): otro usuario modificó el registro
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(request: Request, exc: StaleDataError):
+    return JSONResponse(
+        status_code=409,
+        content={"detail": "The record was modified by another user. Reload it and try again."}
+    )
+
+# Violaciones de unicidad o de claves foráneas que las validaciones previas no detectaron
+# (ej. un ID que ya existe en otra sede, o dos altas simultáneas con el mismo email)
+@app.exception_handler(IntegrityError)
+async def integrity_error_handler(request: Request, exc: IntegrityError):
+    return JSONResponse(
+        status_code=409,
+        content={"detail": "The request conflicts with existing data (duplicate ID or email, or a missing referenced record)."}
+    )
+
 # Incluye los routers de cada entidad
 app.include_router(admin_users.router)
 app.include_router(students.router)
 app.include_router(memberships.router)
 app.include_router(attendance.router)
 app.include_router(routines.router)
+app.include_router(reports.router)
+app.include_router(analytics.router)
 
 
 @app.get("/", tags=["Root"])
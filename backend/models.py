@@ -1,19 +1,23 @@
-from sqlalchemy import Column, String, DateTime, Date, DECIMAL, Boolean, INT, ForeignKey, Computed
+from sqlalchemy import Column, String, DateTime, Date, DECIMAL, Boolean, INT, ForeignKey, Computed, Index, UniqueConstraint, text
 from sqlalchemy.orm import relationship
-from .database import Base
+from .database import Base, TenantScoped
 import datetime
 
-class AdminUser(Base):
+class AdminUser(TenantScoped, Base):
     __tablename__ = "AdminUsers"
+    # El email es único dentro de cada sede, no entre sedes
+    __table_args__ = (UniqueConstraint("TenantID", "Email", name="UQ_AdminUsers_Tenant_Email"),)
 
     AdminUserID = Column(String(255), primary_key=True, index=True)
     Nombre = Column(String(100), nullable=False)
     Apellido = Column(String(100), nullable=True)
-    Email = Column(String(255), nullable=False, unique=True, index=True)
+    Email = Column(String(255), nullable=False)
     Telefono = Column(String(50), nullable=True)
     Role = Column(String(50), nullable=False, default='admin')
     CreatedAt = Column(DateTime, default=datetime.datetime.utcnow)
     UpdatedAt = Column(DateTime, onupdate=datetime.datetime.utcnow)
+    Version = Column(INT, nullable=False, default=1) # Control de concurrencia optimista
+    __mapper_args__ = {"version_id_col": Version}
 
     # Relaciones (si aplican, ej: quién creó a los alumnos)
     students_created = relationship("Student", back_populates="creator")
@@ -22,13 +26,19 @@ class AdminUser(Base):
     attendance_processed = relationship("Attendance", back_populates="processor")
     reminder_settings = relationship("ReminderSetting", back_populates="admin", uselist=False)
 
-class Student(Base):
+class Student(TenantScoped, Base):
     __tablename__ = "Students"
+    __table_args__ = (
+        Index("IX_Students_Tenant_SearchableName", "TenantID", "SearchableName"),
+        # Único por sede; filtrado para permitir varios alumnos sin email (SQL Server solo admite un NULL en UNIQUE)
+        Index("UX_Students_Tenant_Email", "TenantID", "Email", unique=True,
+              mssql_where=text("Email IS NOT NULL"), sqlite_where=text("Email IS NOT NULL")),
+    )
 
     StudentID = Column(String(255), primary_key=True, index=True)
     Nombre = Column(String(100), nullable=False)
     Apellido = Column(String(100), nullable=False)
-    Email = Column(String(255), nullable=True, unique=True, index=True)
+    Email = Column(String(255), nullable=True)
     Telefono = Column(String(50), nullable=True)
     FechaNacimiento = Column(Date, nullable=True)
     Direccion = Column(String(500), nullable=True)
@@ -36,35 +46,68 @@ class Student(Base):
     CreatedAt = Column(DateTime, default=datetime.datetime.utcnow)
     UpdatedAt = Column(DateTime, onupdate=datetime.datetime.utcnow)
     AdminUserID = Column(String(255), ForeignKey("AdminUsers.AdminUserID"))
+    Version = Column(INT, nullable=False, default=1) # Control de concurrencia optimista
+    # SearchableName lo calcula SQL Server; se recupera con OUTPUT en el mismo INSERT/UPDATE
+    __mapper_args__ = {"eager_defaults": True, "version_id_col": Version}
 
     creator = relationship("AdminUser", back_populates="students_created")
     memberships = relationship("Membership", back_populates="student", cascade="all, delete-orphan")
     attendance_records = relationship("Attendance", back_populates="student", cascade="all, delete-orphan")
     routines = relationship("Routine", back_populates="student", cascade="all, delete-orphan")
 
-class Membership(Base):
+class Membership(TenantScoped, Base):
     __tablename__ = "Memberships"
+    __table_args__ = (Index("IX_Memberships_Tenant_StartDate", "TenantID", "StartDate"),)
 
     MembershipID = Column(String(255), primary_key=True, index=True)
     StudentID = Column(String(255), ForeignKey("Students.StudentID"), nullable=False)
     StudentName = Column(String(200), nullable=True)
     Type = Column(String(100), nullable=False)
-    StartDate = Column(DateTime, nullable=False)
+    StartDate = Column(DateTime, nullable=False, index=True)
     EndDate = Column(DateTime, nullable=False)
     Amount = Column(DECIMAL(10, 2), nullable=False)
-    PaymentStatus = Column(String(50), nullable=False, default='pendiente')
+    PaymentStatus = Column(String(50), nullable=False, default='pendiente', index=True)
     QrCodeData = Column(String, nullable=True)
+    QrGeneration = Column(INT, nullable=False, default=0) # Se incrementa al reemitir el QR (ver qr.py)
     CreatedAt = Column(DateTime, default=datetime.datetime.utcnow)
     UpdatedAt = Column(DateTime, onupdate=datetime.datetime.utcnow)
     LastPaymentDate = Column(DateTime, nullable=True)
     AdminUserID = Column(String(255), ForeignKey("AdminUsers.AdminUserID"))
+    Version = Column(INT, nullable=False, default=1) # Control de concurrencia optimista
+    __mapper_args__ = {"version_id_col": Version}
 
     student = relationship("Student", back_populates="memberships")
     creator = relationship("AdminUser", back_populates="memberships_created")
     attendance_link = relationship("Attendance", back_populates="membership_link")
 
-class Attendance(Base):
+class MembershipRevenueSummary(TenantScoped, Base):
+    """Resumen de ingresos por mes, tipo, admin y estado de pago. Se mantiene desde crud.py."""
+    __tablename__ = "MembershipRevenueSummary"
+
+    TenantID = Column(String(100), primary_key=True) # Reemplaza la columna de TenantScoped para formar parte de la PK
+    Period = Column(Date, primary_key=True) # Primer día del mes de StartDate
+    Type = Column(String(100), primary_key=True)
+    AdminUserID = Column(String(255), primary_key=True, default='') # '' cuando la membresía no tiene admin
+    PaymentStatus = Column(String(50), primary_key=True)
+    MembershipCount = Column(INT, nullable=False, default=0)
+    TotalAmount = Column(DECIMAL(14, 2), nullable=False, default=0)
+
+class StudentActivitySummary(TenantScoped, Base):
+    """Actividad reciente por alumno. La recalcula el job de jobs.py; no se edita a mano."""
+    __tablename__ = "StudentActivitySummary"
+    __table_args__ = (Index("IX_StudentActivity_Tenant_LastVisit", "TenantID", "LastVisit"),)
+
+    StudentID = Column(String(255), primary_key=True)
+    StudentName = Column(String(201), nullable=True)
+    LastVisit = Column(DateTime, nullable=True)
+    RecentVisits = Column(INT, nullable=False, default=0) # Visitas en la ventana actual
+    PreviousVisits = Column(INT, nullable=False, default=0) # Visitas en la ventana anterior
+    MembershipEndDate = Column(DateTime, nullable=True) # Fin de la membresía vigente; NULL si no tiene
+    ComputedAt = Column(DateTime, nullable=False)
+
+class Attendance(TenantScoped, Base):
     __tablename__ = "Attendance"
+    __table_args__ = (Index("IX_Attendance_Tenant_Timestamp", "TenantID", "Timestamp"),)
 
     AttendanceID = Column(INT, primary_key=True, index=True, autoincrement=True)
     StudentID = Column(String(255), ForeignKey("Students.StudentID"), nullable=False)
@@ -79,8 +122,9 @@ class Attendance(Base):
     membership_link = relationship("Membership", back_populates="attendance_link")
     processor = relationship("AdminUser", back_populates="attendance_processed")
 
-class Routine(Base):
+class Routine(TenantScoped, Base):
     __tablename__ = "Routines"
+    __table_args__ = (Index("IX_Routines_Tenant_StudentID", "TenantID", "StudentID"),)
 
     RoutineID = Column(String(255), primary_key=True, index=True)
     StudentID = Column(String(255), ForeignKey("Students.StudentID"), nullable=False)
@@ -90,12 +134,15 @@ class Routine(Base):
     AssignmentDate = Column(DateTime, default=datetime.datetime.utcnow)
     LastUpdateDate = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
     AdminUserID = Column(String(255), ForeignKey("AdminUsers.AdminUserID"))
+    Version = Column(INT, nullable=False, default=1) # Control de concurrencia optimista
+    __mapper_args__ = {"version_id_col": Version}
 
     student = relationship("Student", back_populates="routines")
     creator = relationship("AdminUser", back_populates="routines_created")
 
-class ReminderSetting(Base):
+class ReminderSetting(TenantScoped, Base):
     __tablename__ = "ReminderSettings"
+    __table_args__ = (Index("IX_ReminderSettings_Tenant", "TenantID"),)
 
     ReminderSettingID = Column(INT, primary_key=True, index=True, autoincrement=True)
     AdminUserID = Column(String(255), ForeignKey("AdminUsers.AdminUserID"), nullable=False, unique=True)
@@ -105,4 +152,27 @@ class ReminderSetting(Base):
     NotifySMS = Column(Boolean, default=False)
     UpdatedAt = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
 
-    admin = relationship("AdminUser", back_populates="reminder_settings")
\ No newline at end of file
+    admin = relationship("AdminUser", back_populates="reminder_settings")
+
+class AuditLog(TenantScoped, Base):
+    """Registro de cambios (solo inserciones). Lo escribe en lotes el worker de audit.py."""
+    __tablename__ = "AuditLog"
+    __table_args__ = (
+        Index("IX_AuditLog_Tenant_Entity", "TenantID", "Entity", "EntityID"),
+        Index("IX_AuditLog_Tenant_Timestamp", "TenantID", "Timestamp"),
+    )
+
+    AuditID = Column(INT, primary_key=True, autoincrement=True)
+    Timestamp = Column(DateTime, nullable=False)
+    AdminUserID = Column(String(255), nullable=True)
+    Action = Column(String(20), nullable=False) # create, update o delete
+    Entity = Column(String(100), nullable=False) # Nombre de la tabla
+    EntityID = Column(String(255), nullable=False)
+    Changes = Column(String, nullable=False) # JSON con "before" y "after"
+
+class SchemaVersion(Base):
+    """Versión del esquema aplicada en la base de datos (ver bootstrap.py)."""
+    __tablename__ = "SchemaVersion"
+
+    Version = Column(INT, primary_key=True)
+    AppliedAt = Column(DateTime, default=datetime.datetime.utcnow)
@@ -0,0 +1,146 @@
+import base64
+import datetime
+import hashlib
+import hmac
+import os
+import time
+from typing import Dict, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Formato del token: "<versión>.<kid>.<payload>.<firma>" (payload y firma en base64url sin relleno)
+# El payload es "TenantID|StudentID|MembershipID|generación|inicio|fin" con las fechas en segundos epoch:
+# la medianoche local del día de inicio y la medianoche local siguiente al último día (exclusiva).
+# La generación (Memberships.QrGeneration) se incrementa al reemitir el código, lo que invalida los anteriores.
+TOKEN_VERSION = "q2"
+SIGNATURE_BYTES = 16  # HMAC-SHA256 truncado: suficiente para el QR y mantiene el código corto
+MIN_SECRET_LENGTH = 32
+
+
+class InvalidQrToken(ValueError):
+    """El código QR no tiene el formato esperado o su firma no es válida."""
+
+
+class RejectedQrToken(InvalidQrToken):
+    """El código QR es auténtico, pero no se acepta en este momento o en esta sede."""
+
+
+class ExpiredQrToken(RejectedQrToken):
+    """El código QR es auténtico, pero está fuera de la vigencia de la membresía."""
+
+
+class WrongTenantQrToken(RejectedQrToken):
+    """El código QR pertenece a otra sede."""
+
+
+class QrClaims(NamedTuple):
+    TenantID: str
+    StudentID: str
+    MembershipID: str
+    Generation: int
+    StartDate: datetime.datetime
+    EndDate: datetime.datetime
+
+
+def _load_keys() -> Dict[str, bytes]:
+    """
+    Lee las claves de firma de QR_SIGNING_KEYS ("kid1:secreto1,kid2:secreto2").
+    Para rotar claves se añade una nueva y se activa con QR_ACTIVE_KEY_ID;
+    las anteriores se conservan mientras existan códigos firmados con ellas.
+    No hay clave por defecto ni se aceptan secretos cortos (como un valor de ejemplo copiado del .env):
+    con un secreto conocido o adivinable, cualquiera podría falsificar códigos.
+    """
+    raw = os.getenv("QR_SIGNING_KEYS")
+    if not raw:
+        raise RuntimeError("QR_SIGNING_KEYS is not set; configure at least one 'kid:secret' signing key")
+    keys = {}
+    for entry in raw.split(","):
+        kid, _, secret = entry.strip().partition(":")
+        if kid and secret:
+            if len(secret) < MIN_SECRET_LENGTH:
+                raise RuntimeError(f"QR signing key '{kid}' is too short; use a random secret of at least "
+                                   f"{MIN_SECRET_LENGTH} characters")
+            keys[kid] = secret.encode("utf-8")
+    if not keys:
+        raise RuntimeError("QR_SIGNING_KEYS has no usable key; use the format 'kid1:secret1,kid2:secret2'")
+    return keys
+
+
+SIGNING_KEYS = _load_keys()
+ACTIVE_KEY_ID = os.getenv("QR_ACTIVE_KEY_ID", next(iter(SIGNING_KEYS)))
+if ACTIVE_KEY_ID not in SIGNING_KEYS:
+    raise RuntimeError(f"QR_ACTIVE_KEY_ID '{ACTIVE_KEY_ID}' is not one of the keys in QR_SIGNING_KEYS")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(key: bytes, message: str) -> str:
+    return _b64encode(hmac.new(key, message.encode("ascii"), hashlib.sha256).digest()[:SIGNATURE_BYTES])
+
+
+def _local_midnight_epoch(day: datetime.date, tz: datetime.tzinfo) -> int:
+    return int(datetime.datetime.combine(day, datetime.time(), tzinfo=tz).timestamp())
+
+
+def issue_token(tenant_id: str, student_id: str, membership_id: str, generation: int, start: datetime.datetime,
+                end: datetime.datetime, tz: datetime.tzinfo, key_id: Optional[str] = None) -> str:
+    """
+    Genera el contenido firmado del QR para una membresía de la sede indicada.
+    StartDate y EndDate son fechas del calendario de la sede (`tz`): el código vale desde el inicio
+    del primer día hasta el final del último, en hora local.
+    """
+    key_id = key_id or ACTIVE_KEY_ID
+    start_ts = _local_midnight_epoch(start.date(), tz)
+    end_ts = _local_midnight_epoch(end.date() + datetime.timedelta(days=1), tz)
+    fields = [tenant_id, student_id, membership_id, str(generation), str(start_ts), str(end_ts)]
+    payload = _b64encode("|".join(fields).encode("utf-8"))
+    message = f"{TOKEN_VERSION}.{key_id}.{payload}"
+    return f"{message}.{_sign(SIGNING_KEYS[key_id], message)}"
+
+
+def verify_token(token: str, tenant_id: str, now: Optional[float] = None) -> QrClaims:
+    """
+    Valida firma, sede y vigencia de un QR sin consultar la base de datos.
+    La generación se comprueba después, en el propio INSERT de la asistencia.
+    Lanza InvalidQrToken si el código no es auténtico, o RejectedQrToken
+    (ExpiredQrToken, WrongTenantQrToken) si es auténtico pero no se acepta.
+    """
+    parts = token.strip().split(".")
+    if len(parts) != 4 or parts[0] != TOKEN_VERSION:
+        raise InvalidQrToken("Unrecognized QR code format")
+    version, key_id, payload, signature = parts
+    key = SIGNING_KEYS.get(key_id)
+    if key is None:
+        raise InvalidQrToken("Unknown QR signing key")
+    if not hmac.compare_digest(_sign(key, f"{version}.{key_id}.{payload}"), signature):
+        raise InvalidQrToken("Invalid QR signature")
+
+    try:
+        token_tenant_id, student_id, membership_id, generation, start, end = _b64decode(payload).decode("utf-8").split("|")
+        generation, start_ts, end_ts = int(generation), int(start), int(end)
+    except ValueError:
+        raise InvalidQrToken("Malformed QR payload")
+
+    if token_tenant_id != tenant_id:
+        raise WrongTenantQrToken("QR code belongs to another location")
+
+    now = time.time() if now is None else now
+    if not start_ts <= now < end_ts:
+        raise ExpiredQrToken("Membership is not valid at this time")
+
+    return QrClaims(
+        TenantID=token_tenant_id,
+        StudentID=student_id,
+        MembershipID=membership_id,
+        Generation=generation,
+        StartDate=datetime.datetime.utcfromtimestamp(start_ts),
+        EndDate=datetime.datetime.utcfromtimestamp(end_ts),
+    )
@@ -0,0 +1,33 @@
+import datetime
+import json
+from decimal import Decimal
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional; sin él se usa el json estándar
+    orjson = None
+
+
+def _default(obj: Any):
+    """Serializa los tipos que el codificador no soporta igual que lo haría Pydantic."""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Respuesta JSON para listados grandes.
+    Recibe filas ya convertidas en dicts (sin pasar por los schemas de Pydantic)
+    y las codifica con orjson si está instalado.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_default)
+        return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
@@ -2,7 +2,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from .. import crud, models, schemas # '..' para referenciar módulos en el directorio padre
+from .. import audit, crud, models, schemas # '..' para referenciar módulos en el directorio padre
+from ..concurrency import expected_version, if_match_version
 from ..database import get_db
 
 router = APIRouter(
@@ -45,14 +46,17 @@ def read_admin_user(user_id: str, db: Session = Depends(get_db)):
     return db_user
 
 @router.put("/{user_id}", response_model=schemas.AdminUser, summary="Actualizar un usuario administrador")
-def update_admin_user(user_id: str, user_update: schemas.AdminUserUpdate, db: Session = Depends(get_db)):
+def update_admin_user(user_id: str, user_update: schemas.AdminUserUpdate, if_match: Optional[int] = Depends(if_match_version),
+                      db: Session = Depends(get_db)):
     """
     Actualiza la información de un usuario administrador existente.
     Solo los campos proporcionados en el cuerpo de la solicitud serán actualizados.
+    - **Version** (o cabecera If-Match): Si se envía y el usuario cambió desde entonces, responde 409.
     """
     db_user = crud.get_admin_user(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="Admin User not found")
+    crud.check_version(db_user, expected_version(user_update.Version, if_match))
 
     # Verificar si el nuevo email ya está en uso por otro usuario
     if user_update.Email and user_update.Email != db_user.Email:
@@ -61,12 +65,13 @@ def update_admin_user(user_id: str, user_update: schemas.AdminUserUpdate, db: Se
             raise HTTPException(status_code=400, detail=f"Email '{user_update.Email}' is already in use by another user.")
 
     # Aplicar la actualización (SQLAlchemy maneja el objeto db_user directamente)
-    update_data = user_update.dict(exclude_unset=True)
+    update_data = user_update.dict(exclude_unset=True, exclude={"Version"})
+    before = audit.snapshot(db_user, update_data.keys())
     for key, value in update_data.items():
         setattr(db_user, key, value)
     
     db.commit()
-    db.refresh(db_user)
+    audit.record(db, "update", db_user, before=before)
     return db_user
 
 # Nota: La eliminación de AdminUsers podría tener implicaciones en cascada o SET NULL
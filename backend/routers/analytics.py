@@ -0,0 +1,77 @@
+# routers/analytics.py
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from .. import analytics, crud, schemas
+from ..database import get_db
+import datetime
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["Analytics"],
+    responses={404: {"description": "Not found"}},
+)
+
+MAX_INACTIVE_DAYS = 3650
+
+@router.get("/occupancy", response_model=schemas.OccupancyReport, summary="Ocupación por día y hora, con pronóstico")
+def read_occupancy(start: Optional[datetime.date] = None, end: Optional[datetime.date] = None, utc_offset: int = 0,
+                   forecast_days: int = 7, db: Session = Depends(get_db)):
+    """
+    Calcula el promedio de ingresos por día de la semana y hora a partir de la asistencia,
+    y pronostica los ingresos esperados para los próximos días.
+    - **start** / **end**: Rango de fechas (YYYY-MM-DD, `end` exclusivo). Por defecto, las últimas 8 semanas.
+    - **utc_offset**: Diferencia horaria local respecto a UTC en horas (ej. -3).
+    - **forecast_days**: Días a pronosticar (0 a 28).
+    Los resultados se guardan en caché por sede y periodo durante unos segundos.
+    """
+    # Se valida antes de calcular fechas: un desfase fuera de rango desborda el datetime (500)
+    if not -12 <= utc_offset <= 14:
+        raise HTTPException(status_code=400, detail="'utc_offset' must be between -12 and 14.")
+    if not 0 <= forecast_days <= 28:
+        raise HTTPException(status_code=400, detail="'forecast_days' must be between 0 and 28.")
+    try:
+        end = end or analytics.local_today(utc_offset) + datetime.timedelta(days=1)
+        start = start or end - datetime.timedelta(weeks=8)
+        # Límites en UTC de la consulta; también desbordan con fechas cercanas al año 1 o 9999
+        range_start = datetime.datetime.combine(start, datetime.time.min) - datetime.timedelta(hours=utc_offset)
+        range_end = datetime.datetime.combine(end, datetime.time.min) - datetime.timedelta(hours=utc_offset)
+    except OverflowError:
+        raise HTTPException(status_code=400, detail="Date range is out of bounds.")
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'start' must be before 'end'.")
+
+    cache_key = (db.info.get("tenant_id"), start, end, utc_offset, forecast_days)
+    report = analytics.cache_get(cache_key)
+    if report is None:
+        timestamps = crud.get_attendance_timestamps(db, start=range_start, end=range_end)
+        report = analytics.build_occupancy(timestamps, start, end, utc_offset=utc_offset, forecast_days=forecast_days)
+        analytics.cache_set(cache_key, report)
+    return report
+
+@router.get("/inactive-students", response_model=List[schemas.StudentActivity], summary="Alumnos inactivos o con baja frecuencia")
+def read_inactive_students(inactive_days: Optional[int] = None, min_drop: Optional[float] = None, only_active: bool = True,
+                           skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    """
+    Lista alumnos en riesgo de abandono a partir del resumen que calcula el job de actividad.
+    - **inactive_days**: Sin visitas en esta cantidad de días.
+    - **min_drop**: Caída mínima de visitas (0 a 1) respecto a la ventana anterior de 30 días.
+    - **only_active**: Solo alumnos con membresía vigente.
+    Un alumno aparece si cumple cualquiera de los dos criterios indicados; sin criterios se listan todos,
+    empezando por los que llevan más tiempo sin venir.
+    """
+    if inactive_days is not None and not 0 < inactive_days <= MAX_INACTIVE_DAYS:
+        raise HTTPException(status_code=400, detail=f"'inactive_days' must be between 1 and {MAX_INACTIVE_DAYS}.")
+    if min_drop is not None and not 0 < min_drop <= 1:
+        raise HTTPException(status_code=400, detail="'min_drop' must be between 0 and 1.")
+    return crud.get_inactive_students(db, inactive_days=inactive_days, min_drop=min_drop, only_active=only_active,
+                                      skip=skip, limit=limit)
+
+@router.post("/inactive-students/refresh", summary="Recalcular el resumen de actividad de alumnos")
+def refresh_student_activity(db: Session = Depends(get_db)):
+    """
+    Recalcula el resumen de actividad de la sede. Normalmente lo ejecuta el job programado
+    (`python -m backend.jobs`); este endpoint permite forzarlo.
+    """
+    rows = crud.refresh_student_activity(db)
+    return {"message": "Student activity refreshed", "rows": rows}
@@ -2,7 +2,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from .. import crud, models, schemas
+from .. import crud, models, qr, schemas
 from ..database import get_db
 import datetime
 
@@ -35,6 +35,27 @@ def create_attendance_record(attendance: schemas.AttendanceCreate, db: Session =
     
     return crud.create_attendance(db=db, attendance=attendance)
 
+@router.post("/scan", response_model=schemas.Attendance, summary="Registrar asistencia escaneando un código QR")
+def scan_attendance(scan: schemas.AttendanceScan, db: Session = Depends(get_db)):
+    """
+    Registra la asistencia a partir del QR firmado de una membresía.
+    La firma, la sede y la vigencia se validan sin consultar la base de datos;
+    los códigos válidos se registran con un único INSERT, que además comprueba
+    que el código no haya sido reemplazado por uno más reciente.
+    """
+    try:
+        claims = qr.verify_token(scan.QrCodeData, tenant_id=db.info["tenant_id"])
+    except qr.RejectedQrToken as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except qr.InvalidQrToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    db_attendance = crud.create_attendance_from_qr(db, claims=claims, admin_user_id=scan.AdminUserID)
+    if db_attendance is None:
+        # El código es auténtico pero fue reemplazado por uno nuevo, o la membresía ya no existe
+        raise HTTPException(status_code=403, detail="QR code has been revoked or the membership no longer exists")
+    return db_attendance
+
 @router.get("/today", response_model=List[schemas.Attendance], summary="Obtener registros de asistencia de hoy")
 def read_attendance_today(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """
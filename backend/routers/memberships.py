@@ -3,7 +3,9 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from .. import crud, models, schemas
+from ..concurrency import expected_version, if_match_version
 from ..database import get_db
+from ..responses import FastJSONResponse
 import uuid # Para generar IDs si no se proporcionan
 
 router = APIRouter(
@@ -27,10 +29,6 @@ def create_membership(membership: schemas.MembershipCreate, db: Session = Depend
     if not membership.StudentName and db_student:
         membership.StudentName = f"{db_student.Nombre} {db_student.Apellido}".strip()
 
-    # Generar QrCodeData si no se proporcionó
-    if not membership.QrCodeData:
-        membership.QrCodeData = f"studentId:{membership.StudentID};membershipType:{membership.Type}"
-
     return crud.create_membership(db=db, membership=membership)
 
 @router.get("/", response_model=List[schemas.Membership], summary="Obtener lista de todas las membresías")
@@ -38,8 +36,8 @@ def read_memberships(skip: int = 0, limit: int = 100, db: Session = Depends(get_
     """
     Obtiene una lista paginada de todas las membresías registradas.
     """
-    memberships = crud.get_memberships(db, skip=skip, limit=limit)
-    return memberships
+    memberships = crud.get_memberships_rows(db, skip=skip, limit=limit)
+    return FastJSONResponse(memberships)
 
 @router.get("/student/{student_id}", response_model=List[schemas.Membership], summary="Obtener membresías por ID de alumno")
 def read_memberships_by_student(student_id: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
@@ -50,8 +48,8 @@ def read_memberships_by_student(student_id: str, skip: int = 0, limit: int = 100
     if not db_student:
         raise HTTPException(status_code=404, detail=f"Student with ID '{student_id}' not found.")
     
-    memberships = crud.get_memberships_by_student(db, student_id=student_id, skip=skip, limit=limit)
-    return memberships
+    memberships = crud.get_memberships_by_student_rows(db, student_id=student_id, skip=skip, limit=limit)
+    return FastJSONResponse(memberships)
 
 @router.get("/{membership_id}", response_model=schemas.Membership, summary="Obtener una membresía por ID")
 def read_membership(membership_id: str, db: Session = Depends(get_db)):
@@ -64,15 +62,19 @@ def read_membership(membership_id: str, db: Session = Depends(get_db)):
     return db_membership
 
 @router.put("/{membership_id}", response_model=schemas.Membership, summary="Actualizar una membresía")
-def update_membership(membership_id: str, membership_update: schemas.MembershipUpdate, db: Session = Depends(get_db)):
+def update_membership(membership_id: str, membership_update: schemas.MembershipUpdate,
+                      if_match: Optional[int] = Depends(if_match_version), db: Session = Depends(get_db)):
     """
     Actualiza la información de una membresía existente.
     Solo los campos proporcionados en el cuerpo de la solicitud serán actualizados.
     Si se cambia StudentID, se actualiza StudentName si es necesario.
+    - **Version** (o cabecera If-Match): Si se envía y la membresía cambió desde entonces, responde 409.
     """
     db_membership = crud.get_membership(db, membership_id=membership_id)
     if db_membership is None:
         raise HTTPException(status_code=404, detail="Membership not found")
+    version = expected_version(membership_update.Version, if_match)
+    crud.check_version(db_membership, version)
 
     # Si se actualiza el StudentID, verificar que el nuevo estudiante exista
     # y actualizar StudentName si no se proporciona explícitamente en el update.
@@ -84,14 +86,10 @@ def update_membership(membership_id: str, membership_update: schemas.MembershipU
         if membership_update.StudentName is None:
             membership_update.StudentName = f"{new_db_student.Nombre} {new_db_student.Apellido}".strip()
     
-    # Actualizar QrCodeData si cambia StudentID o Type y no se provee explícitamente
-    if (membership_update.StudentID or membership_update.Type) and membership_update.QrCodeData is None:
-        current_student_id = membership_update.StudentID or db_membership.StudentID
-        current_type = membership_update.Type or db_membership.Type
-        membership_update.QrCodeData = f"studentId:{current_student_id};membershipType:{current_type}"
-
+    # crud.update_membership reemite el QR (e invalida el anterior) si cambia el alumno o la vigencia
 
-    updated_membership = crud.update_membership(db, membership_id=membership_id, membership_update=membership_update)
+    updated_membership = crud.update_membership(db, membership_id=membership_id, membership_update=membership_update,
+                                                expected_version=version)
     return updated_membership
 
 
@@ -0,0 +1,51 @@
+# routers/reports.py
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from .. import crud, schemas
+from ..database import get_db
+import datetime
+
+router = APIRouter(
+    prefix="/reports",
+    tags=["Reports"],
+    responses={404: {"description": "Not found"}},
+)
+
+REVENUE_GROUPS = ("period", "type", "admin")
+
+@router.get("/revenue", response_model=List[schemas.RevenueReportRow], summary="Ingresos agrupados por periodo, tipo o admin")
+def read_revenue(group_by: str = "period", start: Optional[datetime.date] = None, end: Optional[datetime.date] = None,
+                 db: Session = Depends(get_db)):
+    """
+    Obtiene los ingresos de membresías desde el resumen precalculado.
+    - **group_by**: `period` (mes de StartDate), `type` o `admin`.
+    - **start** / **end**: Opcionales, filtran por mes (YYYY-MM-DD, se toma el mes de la fecha).
+    """
+    if group_by not in REVENUE_GROUPS:
+        raise HTTPException(status_code=400, detail=f"Invalid group_by. Use one of: {', '.join(REVENUE_GROUPS)}.")
+    return crud.get_revenue_report(db, group_by=group_by, start=start, end=end)
+
+@router.get("/collection-rate", response_model=schemas.CollectionRate, summary="Tasa de cobro de membresías")
+def read_collection_rate(start: Optional[datetime.date] = None, end: Optional[datetime.date] = None, db: Session = Depends(get_db)):
+    """
+    Calcula el monto total, cobrado y pendiente, y la proporción cobrada en el rango de meses indicado.
+    """
+    return crud.get_collection_rate(db, start=start, end=end)
+
+@router.get("/outstanding", response_model=List[schemas.OutstandingBalance], summary="Saldos pendientes por alumno")
+def read_outstanding_balances(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    """
+    Obtiene los alumnos con membresías pendientes de pago, ordenados por monto adeudado.
+    """
+    return crud.get_outstanding_balances(db, skip=skip, limit=limit)
+
+@router.post("/revenue/rebuild", summary="Recalcular el resumen de ingresos")
+def rebuild_revenue_summary(db: Session = Depends(get_db)):
+    """
+    Recalcula por completo el resumen de ingresos desde la tabla de membresías.
+    Solo es necesario la primera vez o si el resumen quedó desincronizado;
+    las altas, cambios y bajas de membresías lo actualizan de forma incremental.
+    """
+    rows = crud.rebuild_revenue_summary(db)
+    return {"message": "Revenue summary rebuilt", "rows": rows}
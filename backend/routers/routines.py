@@ -3,6 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from .. import crud, models, schemas
+from ..concurrency import expected_version, if_match_version
 from ..database import get_db
 import uuid # Para generar IDs si no se proporcionan
 
@@ -51,10 +52,12 @@ def read_routine(routine_id: str, db: Session = Depends(get_db)):
     return db_routine
 
 @router.put("/{routine_id}", response_model=schemas.Routine, summary="Actualizar una rutina")
-def update_routine(routine_id: str, routine_update: schemas.RoutineUpdate, db: Session = Depends(get_db)):
+def update_routine(routine_id: str, routine_update: schemas.RoutineUpdate, if_match: Optional[int] = Depends(if_match_version),
+                   db: Session = Depends(get_db)):
     """
     Actualiza la información de una rutina existente.
     Solo los campos proporcionados en el cuerpo de la solicitud serán actualizados.
+    - **Version** (o cabecera If-Match): Si se envía y la rutina cambió desde entonces, responde 409.
     """
     db_routine = crud.get_routine(db, routine_id=routine_id)
     if db_routine is None:
@@ -69,7 +72,8 @@ def update_routine(routine_id: str, routine_update: schemas.RoutineUpdate, db: S
         if routine_update.StudentName is None: # Actualizar solo si no se está cambiando explícitamente
             routine_update.StudentName = f"{new_db_student.Nombre} {new_db_student.Apellido}".strip()
 
-    updated_routine = crud.update_routine(db, routine_id=routine_id, routine_update=routine_update)
+    updated_routine = crud.update_routine(db, routine_id=routine_id, routine_update=routine_update,
+                                          expected_version=expected_version(routine_update.Version, if_match))
     return updated_routine
 
 @router.delete("/{routine_id}", response_model=schemas.Routine, summary="Eliminar una rutina")
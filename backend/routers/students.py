@@ -1,9 +1,11 @@
 # routers/students.py
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from .. import crud, models, schemas
+from ..concurrency import expected_version, if_match_version
 from ..database import get_db
+from ..responses import FastJSONResponse
 
 router = APIRouter(
     prefix="/students",
@@ -18,8 +20,9 @@ def create_student(student: schemas.StudentCreate, db: Session = Depends(get_db)
 
 @router.get("/", response_model=List[schemas.Student])
 def read_students(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    students = crud.get_students(db, skip=skip, limit=limit)
-    return students
+    # Se leen solo las columnas del schema y se serializan directamente (sin validar fila por fila)
+    students = crud.get_students_rows(db, skip=skip, limit=limit)
+    return FastJSONResponse(students)
 
 @router.get("/{student_id}", response_model=schemas.Student)
 def read_student(student_id: str, db: Session = Depends(get_db)):
@@ -29,8 +32,10 @@ def read_student(student_id: str, db: Session = Depends(get_db)):
     return db_student
 
 @router.put("/{student_id}", response_model=schemas.Student)
-def update_student(student_id: str, student: schemas.StudentUpdate, db: Session = Depends(get_db)):
-    db_student = crud.update_student(db, student_id=student_id, student_update=student)
+def update_student(student_id: str, student: schemas.StudentUpdate, if_match: Optional[int] = Depends(if_match_version),
+                   db: Session = Depends(get_db)):
+    db_student = crud.update_student(db, student_id=student_id, student_update=student,
+                                     expected_version=expected_version(student.Version, if_match))
     if db_student is None:
         raise HTTPException(status_code=404, detail="Student not found")
     return db_student
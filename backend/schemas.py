@@ -21,7 +21,6 @@ class MembershipBase(BaseModel):
     Amount: Decimal
     PaymentStatus: str = Field(pattern=r"^(pagado|pendiente)$") # Valida el status
     StudentName: Optional[str] = None
-    QrCodeData: Optional[str] = None
     AdminUserID: Optional[str] = None
     LastPaymentDate: Optional[datetime.datetime] = None
 
@@ -57,6 +56,10 @@ class MembershipCreate(MembershipBase):
 class AttendanceCreate(AttendanceBase):
     pass
 
+class AttendanceScan(BaseModel):
+    QrCodeData: str
+    AdminUserID: Optional[str] = None
+
 class RoutineCreate(RoutineBase):
     RoutineID: Optional[str] = None
 
@@ -67,6 +70,7 @@ class AdminUserCreate(AdminUserBase):
 class StudentUpdate(StudentBase):
     Nombre: Optional[str] = None
     Apellido: Optional[str] = None
+    Version: Optional[int] = None # Versión leída; también se acepta en la cabecera If-Match
 
 class MembershipUpdate(MembershipBase):
     StudentID: Optional[str] = None
@@ -75,15 +79,18 @@ class MembershipUpdate(MembershipBase):
     EndDate: Optional[datetime.datetime] = None
     Amount: Optional[Decimal] = None
     PaymentStatus: Optional[str] = None
+    Version: Optional[int] = None # Versión leída; también se acepta en la cabecera If-Match
 
 class RoutineUpdate(RoutineBase):
     StudentID: Optional[str] = None
     RoutineName: Optional[str] = None
     ContentHTML: Optional[str] = None
+    Version: Optional[int] = None # Versión leída; también se acepta en la cabecera If-Match
 
 class AdminUserUpdate(AdminUserBase):
     Nombre: Optional[str] = None
     Email: Optional[EmailStr] = None
+    Version: Optional[int] = None # Versión leída; también se acepta en la cabecera If-Match
 
 
 # --- Read Schemas (Para respuestas de API) ---
@@ -92,14 +99,17 @@ class Student(StudentBase):
     CreatedAt: datetime.datetime
     UpdatedAt: Optional[datetime.datetime] = None
     SearchableName: Optional[str] = None
+    Version: int
 
     class Config:
         from_attributes = True # CORREGIDO
 
 class Membership(MembershipBase):
     MembershipID: str
+    QrCodeData: Optional[str] = None # Solo lectura: lo emite y firma el servidor (ver crud.reissue_qr_code)
     CreatedAt: datetime.datetime
     UpdatedAt: Optional[datetime.datetime] = None
+    Version: int
 
     class Config:
         from_attributes = True # CORREGIDO
@@ -115,6 +125,7 @@ class Routine(RoutineBase):
     RoutineID: str
     AssignmentDate: datetime.datetime
     LastUpdateDate: datetime.datetime
+    Version: int
 
     class Config:
         from_attributes = True # CORREGIDO
@@ -123,6 +134,58 @@ class AdminUser(AdminUserBase):
     AdminUserID: str
     CreatedAt: datetime.datetime
     UpdatedAt: Optional[datetime.datetime] = None
+    Version: int
 
     class Config:
         from_attributes = True # CORREGIDO
+
+
+# --- Report Schemas ---
+class RevenueReportRow(BaseModel):
+    Key: str # Periodo (YYYY-MM-DD), tipo de membresía o AdminUserID, según la agrupación
+    MembershipCount: int
+    TotalAmount: Decimal
+    PaidAmount: Decimal
+    PendingAmount: Decimal
+
+class CollectionRate(BaseModel):
+    StartPeriod: Optional[datetime.date] = None
+    EndPeriod: Optional[datetime.date] = None
+    TotalAmount: Decimal
+    PaidAmount: Decimal
+    PendingAmount: Decimal
+    CollectionRate: float
+
+class OutstandingBalance(BaseModel):
+    StudentID: str
+    StudentName: Optional[str] = None
+    PendingMemberships: int
+    PendingAmount: Decimal
+
+
+# --- Analytics Schemas ---
+class OccupancyForecastSlot(BaseModel):
+    Date: datetime.date
+    Hour: int
+    ExpectedCheckIns: float
+
+class OccupancyReport(BaseModel):
+    StartDate: datetime.date
+    EndDate: datetime.date
+    UtcOffset: int
+    Weekdays: List[str]
+    TotalCheckIns: int
+    AverageCheckIns: List[List[float]] # [día de la semana][hora], lunes = 0
+    Forecast: List[OccupancyForecastSlot]
+
+class StudentActivity(BaseModel):
+    StudentID: str
+    StudentName: Optional[str] = None
+    LastVisit: Optional[datetime.datetime] = None
+    RecentVisits: int
+    PreviousVisits: int
+    MembershipEndDate: Optional[datetime.datetime] = None
+    ComputedAt: datetime.datetime
+
+    class Config:
+        from_attributes = True